@@ -0,0 +1,31 @@
+import random
+import time
+from lexical_index import BM25Index
+
+# Benchmark BM25 update cost per chunk and query latency on a synthetic transcript
+num_chunks = 5000
+chunk_words = 270  # 200 new words plus 70 words of overlap, as in MyEventHandler
+num_queries = 500
+
+random.seed(0)
+vocabulary = [f"word{i}" for i in range(20000)] + [f"X-{i}" for i in range(200)] + [str(i) for i in range(1000)]
+# Zipf-like word frequencies, like natural speech
+weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+chunks = [" ".join(random.choices(vocabulary, weights, k=chunk_words)) for _ in range(num_chunks)]
+queries = [" ".join(random.choices(vocabulary, weights, k=6)) for _ in range(num_queries)]
+
+index = BM25Index()
+start = time.perf_counter()
+for i, chunk in enumerate(chunks):
+    index.add(str(i), chunk)
+update_time = time.perf_counter() - start
+
+start = time.perf_counter()
+for query in queries:
+    index.search(query, top_k=3)
+query_time = time.perf_counter() - start
+
+print(f"Indexed {num_chunks} chunks of {chunk_words} words")
+print(f"Update cost per chunk: {update_time / num_chunks * 1e6:.1f} us")
+print(f"Query latency: {query_time / num_queries * 1e3:.2f} ms (over {num_queries} queries)")
@@ -1,5 +1,6 @@
 from pinecone import Pinecone
 import os
+from event_summary import clear_event_summary
 
 pc = Pinecone(api_key=os.environ.get("PINECONE_API_KEY"))  # Or replace with your API key directly
 index_name = os.environ.get("PINECONE_INDEX_NAME")
@@ -10,3 +11,13 @@ index = pc.Index(index_name)
 # Delete all vectors
 index.delete(delete_all=True)
 print("All vectors deleted successfully!")
+
+# Clear the lexical index log so it matches the emptied vector index
+chunk_log_path = os.environ.get("CHUNK_LOG_PATH", "chunk_log.jsonl")
+if os.path.exists(chunk_log_path):
+    open(chunk_log_path, "w").close()
+    print("Chunk log cleared!")
+
+# Remove the rolling summary of the deleted event
+clear_event_summary()
+print("Event summary cleared!")
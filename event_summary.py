@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import re
+import time
+
+# Where the ingestion side writes the rolling summary and rag_query reads it
+summary_path = os.getenv("EVENT_SUMMARY_PATH", "event_summary.json")
+
+# Number of chunks (or summaries) folded into one summary at the next level
+group_size = 4
+
+# Overview questions have to be about the event as a whole, so the patterns are
+# matched against the entire question rather than searched for inside it
+event_words = r"(the |this )?(whole |entire )?(event|talk|session|meeting|conversation|discussion|presentation)"
+so_far = r"( so far| until now| up to now)?"
+overview_patterns = [re.compile(pattern) for pattern in [
+    rf"((can|could) you |please )*(summari[sz]e|recap|sum up)( {event_words}| it| everything)?{so_far}( for me)?( please)?",
+    rf"((can|could) you |please )*give (me |us )?(a |an )?(summary|recap|overview|rundown) of {event_words}{so_far}",
+    rf"(what is|what's) (the |a )?(summary|recap|overview|gist) of {event_words}{so_far}",
+    rf"what (was|is|has) {event_words} (been )?about{so_far}",
+    rf"what (has been|was|have they|did they) (discussed|covered|said|talked about|discuss|cover|say|talk about){so_far}",
+    rf"what are the (main|key) (points|takeaways|topics)( of {event_words})?{so_far}",
+]]
+
+def is_overview_question(query):
+    """Return True for questions about the event as a whole rather than a detail"""
+    question = query.strip().rstrip("?.!").lower()
+    return any(pattern.fullmatch(question) for pattern in overview_patterns)
+
+def load_event_summary(path=summary_path):
+    """Read the rolling summary plus the latest chunks not folded into it yet, as
+    overview context, or None if nothing has been transcribed yet"""
+    try:
+        with open(path) as file:
+            saved = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    parts = []
+    if saved.get("summary"):
+        parts.append(f"Summary of the event so far: {saved['summary']}")
+    if saved.get("recent"):
+        recent = "\n".join(saved["recent"])
+        parts.append(f"Latest part of the event, not yet in the summary:\n{recent}")
+    return "\n\n".join(parts) or None
+
+def clear_event_summary(path=summary_path):
+    if os.path.exists(path):
+        os.remove(path)
+
+class HierarchicalSummary:
+    """Rolling summary tree: every group_size items at one level are summarized
+    into a single item at the level above. The event summary is rebuilt from the
+    unfolded summaries of every level, so it only costs a call when a group closes.
+    Raw chunks not folded yet are saved alongside it on every refresh."""
+
+    def __init__(self, summarize, group_size=group_size, path=summary_path):
+        self.summarize = summarize  # async callable: list[str] -> str
+        self.group_size = group_size
+        self.path = path
+        self.levels = [[]]  # levels[0] holds raw chunks, levels[i] holds summaries
+        self.chunk_count = 0
+        self.summary = None  # summary of everything folded out of levels[0]
+        self.lock = asyncio.Lock()
+        clear_event_summary(path)  # a new session must not serve the previous event's summary
+
+    def add_chunk(self, chunk):
+        self.levels[0].append(chunk)
+        self.chunk_count += 1
+
+    async def refresh(self, final=False):
+        """Fold every full group upwards, rebuild the summary if anything was folded
+        and save it together with the unfolded chunks"""
+        async with self.lock:
+            changed = await self.fold()
+
+            if final:
+                # Nothing more is coming, so fold the tail into the summary too
+                frontier = [item for level in reversed(self.levels) for item in level]
+            elif changed:
+                frontier = [item for level in reversed(self.levels[1:]) for item in level]
+            else:
+                frontier = []
+
+            if len(frontier) == 1 and (not final or not self.levels[0]):
+                self.summary = frontier[0]
+            elif frontier:
+                self.summary = await self.summarize(frontier)
+            self.save([] if final else list(self.levels[0]))
+
+    async def fold(self):
+        changed = False
+        level = 0
+        while level < len(self.levels):
+            while len(self.levels[level]) >= self.group_size:
+                group = self.levels[level][:self.group_size]
+                summary = await self.summarize(group)
+                self.levels[level] = self.levels[level][self.group_size:]
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                self.levels[level + 1].append(summary)
+                changed = True
+            level += 1
+        return changed
+
+    def save(self, recent):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({
+                "summary": self.summary,
+                "recent": recent,
+                "chunk_count": self.chunk_count,
+                "updated_at": time.time()
+            }, file)
+        os.replace(tmp_path, self.path)
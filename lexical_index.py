@@ -0,0 +1,208 @@
+import json
+import math
+import os
+import re
+import threading
+from array import array
+
+# Chunks appended by the ingestion side and replayed by rag_query
+chunk_log_path = os.getenv("CHUNK_LOG_PATH", "chunk_log.jsonl")
+
+# BM25 parameters
+k1 = 1.2
+b = 0.75
+
+# Reciprocal rank fusion constant
+rrf_k = 60
+
+token_pattern = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+exact_token_pattern = re.compile(r"\d|^[A-Z]{2,}$|[a-z][A-Z]")
+
+# Question words and stopwords carry no weight when judging what a query is about
+stopwords = {
+    "a", "an", "and", "are", "as", "at", "be", "been", "but", "by", "can", "could", "did",
+    "do", "does", "for", "from", "had", "has", "have", "he", "her", "his", "how", "i", "in",
+    "is", "it", "its", "me", "mention", "mentioned", "of", "on", "or", "said", "say", "she",
+    "tell", "that", "the", "their", "them", "they", "this", "to", "us", "was", "we", "were",
+    "what", "when", "where", "which", "who", "whom", "whose", "why", "will", "with", "would",
+    "you", "about", "there", "talk", "talked", "speak", "spoke"
+}
+
+# Words that only ask for a property of an exact term ("the price of X-200"), so
+# they do not count against it when judging whether exact terms dominate
+attribute_words = {
+    "price", "cost", "number", "date", "time", "year", "name", "code", "version",
+    "model", "amount", "figure", "total", "size", "value", "percent", "percentage"
+}
+
+append_lock = threading.Lock()
+
+def tokenize(text):
+    return token_pattern.findall(text.lower())
+
+def append_chunk_log(chunk_id, text, path=chunk_log_path):
+    """Append a chunk to the log that rag_query replays into its BM25 index"""
+    line = json.dumps({"id": chunk_id, "chunk": text}) + "\n"
+    with append_lock:
+        with open(path, "ab+") as file:
+            # Start on a fresh line if a previous writer died mid-line
+            end = file.seek(0, os.SEEK_END)
+            if end:
+                file.seek(end - 1)
+                if file.read(1) != b"\n":
+                    line = "\n" + line
+            file.write(line.encode())
+
+def exact_terms(query):
+    """Names, codes, numbers and quoted phrases in the query"""
+    quoted = re.findall(r'"([^"]+)"', query)
+    words = re.findall(r"[\w.\-]+", re.sub(r'"[^"]*"', " ", query))
+    # Capitalized words count as names, except the first word of the question
+    return quoted + [
+        word for i, word in enumerate(words)
+        if word.lower() not in stopwords
+        and (exact_token_pattern.search(word) or (i > 0 and word[0].isupper()))
+    ]
+
+def is_exact_term_query(query, threshold=0.5):
+    """Return True when most of the query is names, codes or numbers that embeddings match poorly"""
+    exact = exact_terms(query)
+    words = re.findall(r"[\w.\-]+", re.sub(r'"[^"]*"', " ", query))
+    content_words = [
+        word for word in words
+        if word.lower() not in stopwords and word.lower() not in attribute_words
+    ]
+    content_count = len(content_words) + len(re.findall(r'"([^"]+)"', query))
+    # Strictly more than the threshold, so a name plus a topic stays a semantic question
+    return bool(exact) and len(exact) / content_count > threshold
+
+class BM25Index:
+    """Incrementally updated BM25 inverted index.
+
+    Postings are kept as parallel arrays of document numbers and term
+    frequencies per term, appended in document order so they never need sorting."""
+
+    def __init__(self):
+        self.vocab = {}  # term -> term number
+        self.postings_docs = []  # term number -> array of document numbers
+        self.postings_freqs = []  # term number -> array of term frequencies
+        self.doc_lengths = array('I')
+        self.doc_keys = []  # document number -> (chunk id, chunk text)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_keys)
+
+    def add(self, chunk_id, text):
+        doc = len(self.doc_keys)
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        for token, count in counts.items():
+            term = self.vocab.get(token)
+            if term is None:
+                term = len(self.postings_docs)
+                self.vocab[token] = term
+                self.postings_docs.append(array('I'))
+                self.postings_freqs.append(array('I'))
+            self.postings_docs[term].append(doc)
+            self.postings_freqs[term].append(count)
+
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.doc_keys.append((chunk_id, text))
+        self.total_length += length
+
+    def has_terms(self, terms):
+        """Return True when every token of every term occurs somewhere in the index"""
+        tokens = [token for term in terms for token in tokenize(term)]
+        return bool(tokens) and all(token in self.vocab for token in tokens)
+
+    def search(self, query, top_k=3):
+        n = len(self.doc_keys)
+        if n == 0:
+            return []
+        avgdl = self.total_length / n
+
+        scores = {}
+        for token in set(tokenize(query)):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            docs = self.postings_docs[term]
+            freqs = self.postings_freqs[term]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, freq in zip(docs, freqs):
+                norm = k1 * (1 - b + b * self.doc_lengths[doc] / avgdl)
+                scores[doc] = scores.get(doc, 0.0) + idf * freq * (k1 + 1) / (freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {"id": self.doc_keys[doc][0], "score": score, "metadata": {"chunk": self.doc_keys[doc][1]}}
+            for doc, score in ranked
+        ]
+
+class LexicalIndex(BM25Index):
+    """BM25 index that replays the append-only chunk log written by the ingestion side"""
+
+    def __init__(self, path=chunk_log_path):
+        super().__init__()
+        self.path = path
+        self.offset = 0
+        self.log_identity = None  # (inode, first line) of the log this index was built from
+        self.lock = threading.Lock()
+
+    def reset(self):
+        BM25Index.__init__(self)
+        self.offset = 0
+        self.log_identity = None
+
+    def sync(self):
+        """Index chunks appended to the log since the last sync"""
+        with self.lock:
+            try:
+                with open(self.path) as file:
+                    first_line = file.readline()
+                    if not first_line:
+                        self.reset()  # the log was cleared, so was the event
+                        return
+                    if not first_line.endswith("\n"):
+                        return  # first chunk still being written
+                    # Chunk ids are unique, so a cleared or replaced log starts differently
+                    log_identity = (os.fstat(file.fileno()).st_ino, first_line)
+                    if log_identity != self.log_identity:
+                        self.reset()
+                        self.log_identity = log_identity
+
+                    file.seek(self.offset)
+                    for line in iter(file.readline, ""):
+                        if not line.endswith("\n"):
+                            break  # partially written line, pick it up next time
+                        self.offset = file.tell()
+                        try:
+                            record = json.loads(line)
+                            self.add(record["id"], record["chunk"])
+                        except (ValueError, KeyError, TypeError) as e:
+                            print(f"Skipping bad chunk log line: {str(e)}")
+            except FileNotFoundError:
+                self.reset()
+            except OSError as e:
+                print(f"Failed to read chunk log: {str(e)}")
+
+    def has_terms(self, terms):
+        with self.lock:
+            return super().has_terms(terms)
+
+    def search(self, query, top_k=3):
+        with self.lock:
+            return super().search(query, top_k)
+
+def reciprocal_rank_fusion(result_lists, top_k=6):
+    """Merge ranked match lists by summing 1 / (rrf_k + rank) per chunk id"""
+    fused = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match["id"], {**match, "score": 0.0})
+            entry["score"] += 1 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)[:top_k]
@@ -6,7 +6,10 @@ from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 from asyncio import Semaphore
-from ragEmbed import async_update_db
+from uuid import uuid4
+from ragEmbed import async_update_db, async_summarize
+from event_summary import HierarchicalSummary
+from lexical_index import append_chunk_log
 
 app = FastAPI()
 audio_queue = queue.Queue()
@@ -20,6 +23,7 @@ class MyEventHandler(TranscriptResultStreamHandler):
         self.previous_chunk_end = []
         self.last_transcript = ""
         self.upsert_sem = Semaphore(5)
+        self.summary = HierarchicalSummary(async_summarize)
 
     async def handle_transcript_event(self, transcript_event: TranscriptEvent):
         results = transcript_event.transcript.results
@@ -50,21 +54,39 @@ class MyEventHandler(TranscriptResultStreamHandler):
         self.current_words = self.current_words[self.chunk_size:]
 
         chunk_text = " ".join(new_chunk_words)
-        asyncio.create_task(self.upsert_to_vector_db(chunk_text))
+        chunk_id = str(uuid4())
+        asyncio.create_task(self.upsert_to_vector_db(chunk_text, chunk_id))
+        self.summary.add_chunk(chunk_text)
+        asyncio.create_task(self.refresh_summary())
 
     async def final_flush(self):
         if self.current_words:
             chunk_start = max(0, len(self.previous_chunk_end) - self.overlap_size)
             chunk_text = " ".join(self.previous_chunk_end[chunk_start:] + self.current_words)
-            await self.upsert_to_vector_db(chunk_text)
+            chunk_id = str(uuid4())
+            await self.upsert_to_vector_db(chunk_text, chunk_id)
+            self.summary.add_chunk(chunk_text)
+        await self.refresh_summary(final=True)
+
+    async def upsert_to_vector_db(self, chunk, chunk_id):
+        try:
+            # The chunk log feeds the BM25 index in rag_query
+            await asyncio.to_thread(append_chunk_log, chunk_id, chunk)
+        except Exception as e:
+            print(f"Failed to log chunk: {str(e)}")
 
-    async def upsert_to_vector_db(self, chunk):
         async with self.upsert_sem:
             try:
-                await async_update_db(chunk)
+                await async_update_db(chunk, chunk_id)
             except Exception as e:
                 print(f"Failed to upsert: {str(e)}")
 
+    async def refresh_summary(self, final=False):
+        try:
+            await self.summary.refresh(final=final)
+        except Exception as e:
+            print(f"Failed to refresh summary: {str(e)}")
+
 async def write_chunks(stream):
     while True:
         if not audio_queue.empty():
@@ -5,7 +5,11 @@ from tenacity import retry, wait_exponential, stop_after_attempt
 from asyncio import Semaphore
 import asyncio
 import json
+import os
+import time
 from datetime import datetime
+from dotenv import load_dotenv
+load_dotenv()
 timestamp = datetime.utcnow().isoformat() 
 
 # Initialize Pinecone client
@@ -15,6 +19,7 @@ pc = Pinecone(
 
 # Configuration
 modelId = "amazon.titan-embed-text-v2:0"
+summary_modelId = os.getenv("MODEL_ID")
 index_name = "qucoon-realtimerag"
 
 # Serverless configuration
@@ -62,13 +67,13 @@ async def initialize_clients():
 @retry(wait=wait_exponential(multiplier=1, min=2, max=10), 
        stop=stop_after_attempt(3),
        reraise=True)
-async def async_update_db(chunk: str):
+async def async_update_db(chunk: str, chunk_id: str = None):
     """Asynchronously process and upsert a chunk with retries"""
     global index, bedrock_session
     
     try:
         async with upsert_semaphore:
-            chunk_id = str(uuid4())
+            chunk_id = chunk_id or str(uuid4())
             
             async with bedrock_session.client(
                 service_name='bedrock-runtime',
@@ -96,7 +101,8 @@ async def async_update_db(chunk: str):
                 "values": embedding,
                 "metadata": {
                     "chunk": chunk,
-                    "time_param": timestamp  # Store time inside metadata
+                    "time_param": timestamp,  # Store time inside metadata
+                    "ingested_at": time.time()  # Numeric, so queries can filter on it
                 }
             }])
 
@@ -107,6 +113,38 @@ async def async_update_db(chunk: str):
         print(f"UPSERT ERROR: {str(e)}")
         raise  
 
+summary_prompt = """
+You are summarizing a live event transcript. Condense the passages below into a short summary that keeps who spoke, the main topics, decisions, names and numbers, in the order they came up. Do not add anything that is not in the passages.
+
+<passages>
+{passages}
+</passages>
+"""
+
+@retry(wait=wait_exponential(multiplier=1, min=2, max=10), 
+       stop=stop_after_attempt(3),
+       reraise=True)
+async def async_summarize(passages):
+    """Summarize a list of transcript passages into one short passage"""
+    global bedrock_session
+
+    try:
+        async with bedrock_session.client(
+            service_name='bedrock-runtime',
+            region_name='us-east-1'
+        ) as bedrock:
+            response = await bedrock.converse(
+                modelId=summary_modelId,
+                messages=[{"role": "user", "content": [{"text": "Summarize these passages."}]}],
+                system=[{"text": summary_prompt.format(passages="\n\n".join(passages))}],
+                inferenceConfig={"maxTokens": 500, "temperature": 0},
+            )
+            return response['output']['message']['content'][0]['text']
+
+    except Exception as e:
+        print(f"SUMMARY ERROR: {str(e)}")
+        raise
+
 async def startup():
     await initialize_clients()
 
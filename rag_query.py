@@ -2,14 +2,18 @@ import os
 import boto3
 import asyncio
 import json
+import re
 import time
 import streamlit as st
 import streamlit_authenticator as stauth
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 import yaml
 from yaml.loader import SafeLoader
 from dotenv import load_dotenv
 from pinecone import Pinecone
+from event_summary import is_overview_question, load_event_summary
+from lexical_index import LexicalIndex, exact_terms, is_exact_term_query, reciprocal_rank_fusion, stopwords
 load_dotenv()
 
 # Access environment variables
@@ -30,6 +34,13 @@ def init_pinecone():
 # Initialize the Pinecone index
 index = init_pinecone()
 
+@st.cache_resource
+def init_lexical_index():
+    return LexicalIndex()
+
+# BM25 index over the chunk log written by the transcription handler
+lexical_index = init_lexical_index()
+
 prompt_template = """ 
 You are an AI assistant with access to knowledge about any event or conversation. You respond to the user question as if you have the event or conversation in your knowledge base.
 
@@ -50,7 +61,75 @@ Question: {question}
 Helpful Answer:
 """
 
-def get_answer_from_event(query):
+# Follow-up handling
+follow_up_similarity = 0.8  # cosine similarity to the previous query that counts as a follow-up
+max_context_matches = 6
+history_token_budget = 1000
+history_message_tokens = 200
+ingest_lag_seconds = 30  # chunks are stamped before they become visible in the index
+delta_score_floor = 0.35  # new chunks on a follow-up must be at least this similar to be added
+
+# Multi-query expansion
+multi_query_enabled = True
+max_sub_queries = 4
+# Greedy prefix, so the topic list follows the last topic-introducing preposition
+topic_pattern = re.compile(r"^(.*\b(?:about|on|regarding|of|for))\s+(.+)$", re.IGNORECASE)
+topic_separator = re.compile(r"\s*(?:,\s*(?:and\s+)?|\s+and\s+|\s+or\s+)\s*", re.IGNORECASE)
+max_topic_words = 4
+determiners = {"the", "a", "an", "their", "his", "her", "our"}
+# Fixed expressions that read as one topic even though they contain "and"
+fixed_phrases = {
+    "rock and roll", "research and development", "mergers and acquisitions", "q and a",
+    "pros and cons", "terms and conditions", "profit and loss", "supply and demand",
+    "health and safety", "trial and error", "black and white", "salt and pepper"
+}
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def compress_history(history, budget=history_token_budget):
+    """Keep the most recent chat turns that fit in the token budget, truncating long ones"""
+    kept = []
+    used = 0
+    for message in reversed(history):
+        text = message["content"]
+        if estimate_tokens(text) > history_message_tokens:
+            text = text[:history_message_tokens * 4] + "..."
+        tokens = estimate_tokens(text)
+        if used + tokens > budget:
+            break
+        kept.append({"role": message["role"], "text": text})
+        used += tokens
+    kept.reverse()
+
+    # Converse expects alternating turns that start with the user
+    message_list = []
+    for message in kept:
+        if message_list and message_list[-1]["role"] == message["role"]:
+            message_list[-1]["content"][0]["text"] += "\n" + message["text"]
+        elif message_list or message["role"] == "user":
+            message_list.append({"role": message["role"], "content": [{"text": message["text"]}]})
+    return message_list
+
+def converse_with_context(query, context_string, history=None):
+    message_list = compress_history(history or [])
+    if message_list and message_list[-1]["role"] == "user":
+        message_list[-1]["content"][0]["text"] += "\n" + query
+    else:
+        message_list.append({"role": "user", "content": [{"text": query}]})
+    response = bedrock.converse(
+        modelId=modelId,
+        messages=message_list,
+        system=[
+            {"text": prompt_template.format(context=context_string, question=query)},
+        ],
+        inferenceConfig={"maxTokens": 2000, "temperature": 1},
+    )
+    
+    response_message = response['output']['message']['content'][0]['text']
+    return response_message
+
+def embed_query(query):
     input_data = {
         "inputText": query,
         "dimensions": 1024,
@@ -67,25 +146,153 @@ def get_answer_from_event(query):
 
     response_body = response['body'].read()
     response_json = json.loads(response_body)
-    query_embedding = response_json['embedding']
-
-    result = index.query(vector=query_embedding, top_k=3, include_metadata=True)
-
-    context = [f"Score: {match['score']}, Metadata: {match['metadata']}" for match in result['matches']]
+    return response_json['embedding']
+
+def is_follow_up(query_embedding, retrieval_state):
+    """A follow-up is compared with the query of the last full retrieval, so a chain
+    of drifting follow-ups eventually falls back to a full retrieval"""
+    anchor_embedding = retrieval_state.get("query_embedding") if retrieval_state else None
+    return anchor_embedding is not None and sum(
+        a * b for a, b in zip(query_embedding, anchor_embedding)
+    ) >= follow_up_similarity
+
+def vector_search(query_embedding, filter=None):
+    """Return the top matches for one query embedding as plain dicts"""
+    result = index.query(vector=query_embedding, top_k=3, include_metadata=True, filter=filter)
+    return [
+        {"id": match['id'], "score": match['score'], "metadata": match['metadata']}
+        for match in result['matches']
+    ]
+
+def retrieve(query_embedding, retrieval_state=None):
+    """Query the index, reusing the previous retrieval when the query is a close follow-up.
+
+    A follow-up keeps the cached context first and only adds chunks ingested since
+    then that clear delta_score_floor. It still costs one Pinecone query, so what
+    it saves is context continuity, not calls.
+
+    retrieval_state is a per-session dict holding the query embedding of the last
+    full retrieval, the matches answered from and when they were retrieved. It is
+    updated in place."""
+    follow_up = is_follow_up(query_embedding, retrieval_state)
+
+    retrieved_at = time.time() - ingest_lag_seconds
+    if follow_up:
+        cached = retrieval_state["matches"]
+        seen = {match["id"] for match in cached}
+        delta = [
+            match for match in vector_search(query_embedding, {"ingested_at": {"$gt": retrieval_state["retrieved_at"]}})
+            if match["score"] >= delta_score_floor and match["id"] not in seen
+        ]
+        # Make room for relevant new chunks, but keep the cached context ahead of them
+        cached = cached[:max(max_context_matches - len(delta), 0)]
+        matches = cached + delta
+    else:
+        matches = vector_search(query_embedding)
+
+    if retrieval_state is not None:
+        retrieval_state.update({"matches": matches, "retrieved_at": retrieved_at})
+        if not follow_up:
+            retrieval_state["query_embedding"] = query_embedding
+    return matches
+
+def strip_determiners(text):
+    words = text.lower().split()
+    while words and words[0] in determiners:
+        words = words[1:]
+    return words
+
+def is_topic_list(topics):
+    """Return True when every split part reads like a short noun phrase.
+
+    A last topic longer than the others ("Q3 and Q4 revenue") shares its head noun
+    with them, so it is not treated as a list."""
+    lengths = [len(strip_determiners(topic)) for topic in topics]
+    if lengths[-1] > max(lengths[:-1]):
+        return False
+    for topic in topics:
+        words = topic.lower().split()
+        if not words or len(words) > max_topic_words:
+            return False
+        if any(word in stopwords for word in words if word not in determiners):
+            return False
+    return True
+
+def expand_query(query):
+    """Split a question that combines topics into one sub-query per topic.
+
+    "what did they say about funding and hiring?" becomes the original question
+    plus "what did they say about funding" and "what did they say about hiring"."""
+    sub_queries = []
+    for question in re.split(r"(?<=[?.!])\s+", query.strip()):
+        question = question.strip().rstrip("?.!")
+        match = topic_pattern.match(question)
+        topics = []
+        if match and " ".join(strip_determiners(match.group(2))) not in fixed_phrases:
+            topics = topic_separator.split(match.group(2))
+        if len(topics) > 1 and is_topic_list(topics):
+            sub_queries += [f"{match.group(1)} {topic}" for topic in topics]
+        elif question:
+            sub_queries.append(question)
+
+    if len(sub_queries) < 2:
+        return [query]
+    return [query] + sub_queries[:max_sub_queries - 1]
+
+def search_sub_query(sub_query):
+    return vector_search(embed_query(sub_query))
+
+def multi_query_retrieve(queries, lexical_matches, retrieval_state=None):
+    """Embed and query the sub-queries concurrently and merge the ranked lists.
+
+    The original question is embedded first, so a close follow-up to the last full
+    retrieval is served by retrieve() without embedding or searching sub-queries."""
+    query_embedding = embed_query(queries[0])
+    if is_follow_up(query_embedding, retrieval_state):
+        return reciprocal_rank_fusion(
+            [retrieve(query_embedding, retrieval_state), lexical_matches], top_k=max_context_matches
+        )
+
+    # A per-call pool, so concurrent sessions do not queue behind each other
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        original = pool.submit(retrieve, query_embedding, retrieval_state)
+        others = [pool.submit(search_sub_query, sub_query) for sub_query in queries[1:]]
+        result_lists = [original.result()] + [future.result() for future in others]
+
+    result_lists += [lexical_matches] + [lexical_index.search(sub_query, top_k=3) for sub_query in queries[1:]]
+    return reciprocal_rank_fusion(result_lists, top_k=max_context_matches)
+
+def get_answer_from_event(query, history=None, retrieval_state=None):
+    # Overview questions are answered from the precomputed rolling summary
+    if is_overview_question(query):
+        event_summary = load_event_summary()
+        if event_summary:
+            return converse_with_context(query, event_summary, history)
+
+    lexical_index.sync()
+    lexical_matches = lexical_index.search(query, top_k=3)
+
+    # Names, codes and numbers are matched better lexically, so skip the embedding call
+    # when all of them actually occur in the transcript
+    if lexical_matches and is_exact_term_query(query) and lexical_index.has_terms(exact_terms(query)):
+        matches = lexical_matches
+    else:
+        queries = expand_query(query) if multi_query_enabled else [query]
+        if len(queries) > 1:
+            matches = multi_query_retrieve(queries, lexical_matches, retrieval_state)
+        else:
+            query_embedding = embed_query(query)
+            vector_matches = retrieve(query_embedding, retrieval_state)
+            matches = reciprocal_rank_fusion([vector_matches, lexical_matches], top_k=max_context_matches)
+
+        # Cache the merged context that was actually answered from
+        if retrieval_state is not None:
+            retrieval_state["matches"] = matches
+
+    context = [f"Score: {match['score']}, Metadata: {match['metadata']}" for match in matches]
     context_string = "\n".join(context)
     
-    message_list = [{"role": "user", "content": [{"text": query}]}]
-    response = bedrock.converse(
-        modelId=modelId,
-        messages=message_list,
-        system=[
-            {"text": prompt_template.format(context=context_string, question=query)},
-        ],
-        inferenceConfig={"maxTokens": 2000, "temperature": 1},
-    )
-    
-    response_message = response['output']['message']['content'][0]['text']
-    return response_message
+    return converse_with_context(query, context_string, history)
 
 # Load configuration
 with open('config.yaml') as file:
@@ -131,6 +338,8 @@ if st.session_state.get("authentication_status"):
         if st.session_state.transcription_active:
             if "messages" not in st.session_state:
                 st.session_state.messages = []
+            if "retrieval" not in st.session_state:
+                st.session_state.retrieval = {}
 
             if len(st.session_state.messages) == 0:
                 assistant_message = "Hello! How can I assist you with the event today?"
@@ -156,7 +365,11 @@ if st.session_state.get("authentication_status"):
                     st.markdown(user_input)
 
                 with st.spinner("Generating response..."):
-                    assistant_response = get_answer_from_event(user_input)
+                    assistant_response = get_answer_from_event(
+                        user_input,
+                        history=st.session_state.messages[:-1],
+                        retrieval_state=st.session_state.retrieval
+                    )
 
                 with st.chat_message("assistant"):
                     st.markdown(assistant_response)